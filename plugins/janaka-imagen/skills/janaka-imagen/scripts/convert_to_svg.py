@@ -26,88 +26,112 @@ Requirements:
 """
 
 import argparse
+import functools
+import io
 import sys
 import tempfile
 from pathlib import Path
 
+# Optional dependencies are resolved once at import; the error is only
+# reported when a feature that needs them is used.
+try:
+    import vtracer as _vtracer
+except ImportError:
+    _vtracer = None
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+
+# Alpha -> mask lookup table: pixels below 128 alpha become transparent
+ALPHA_MASK_LUT = [0] * 128 + [255] * 128
+
 
 def check_vtracer():
     """Check if vtracer is installed."""
-    try:
-        import vtracer
-        return vtracer
-    except ImportError:
+    if _vtracer is None:
         print("Error: vtracer not installed. Install with: pip install vtracer", file=sys.stderr)
         sys.exit(1)
+    return _vtracer
+
 
+@functools.lru_cache(maxsize=16)
+def palette_image(colors: tuple[tuple[int, int, int, int], ...]):
+    """Build a "P" mode image holding the palette, for use with Image.quantize().
 
-def quantize_to_palette(input_path: Path, colors: list[tuple[int, int, int, int]]) -> Path:
+    Cached per palette; Pillow's converter maps pixels through its own
+    lookup cache, so the palette image is all that needs precomputing.
+    """
+    flat = [channel for color in colors for channel in color[:3]]
+    # Pad to 256 entries by repeating the palette (zero padding would add black)
+    flat = (flat * (256 // len(colors) + 1))[:768]
+
+    pal_img = Image.new("P", (1, 1))
+    pal_img.putpalette(flat)
+    return pal_img
+
+
+def quantize_to_palette(input_path: Path, colors: tuple[tuple[int, int, int, int], ...]) -> bytes | None:
     """
     Quantize image to a fixed color palette for cleaner SVG conversion.
 
     Args:
         input_path: Path to input image
-        colors: List of RGBA tuples to quantize to
+        colors: RGBA tuples to quantize to
 
     Returns:
-        Path to temporary quantized image
+        PNG-encoded bytes of the quantized image, or None if the image
+        already uses only palette colors (and transparent pixels)
     """
-    try:
-        from PIL import Image
-        import numpy as np
-    except ImportError:
+    if Image is None:
         print("Error: pillow not installed. Install with: pip install pillow", file=sys.stderr)
         sys.exit(1)
 
     img = Image.open(input_path).convert("RGBA")
-    data = np.array(img)
-
-    # Convert colors to numpy arrays
-    palette = [np.array(c) for c in colors]
 
-    # Find transparent color (if any)
-    transparent = np.array([0, 0, 0, 0])
+    # Skip re-quantizing an already quantized image. getcolors() gives up
+    # (returns None) as soon as it sees more colors than the palette allows.
+    image_colors = img.getcolors(maxcolors=len(colors) + 1)
+    if image_colors is not None:
+        allowed = set(colors) | {(0, 0, 0, 0)}
+        if all(color in allowed for _, color in image_colors):
+            return None
 
-    result = np.zeros_like(data)
+    # Find closest color (RGB distance only) with Pillow's C quantizer
+    quantized = img.convert("RGB").quantize(palette=palette_image(colors), dither=Image.Dither.NONE)
 
-    for y in range(data.shape[0]):
-        for x in range(data.shape[1]):
-            pixel = data[y, x]
+    # If mostly transparent, keep transparent: one table lookup builds the
+    # mask, one composite clears masked-out pixels to (0, 0, 0, 0)
+    opaque = img.getchannel("A").point(ALPHA_MASK_LUT)
+    result = Image.composite(quantized.convert("RGBA"), Image.new("RGBA", img.size), opaque)
 
-            # If mostly transparent, keep transparent
-            if pixel[3] < 128:
-                result[y, x] = transparent
-                continue
+    # Encode in memory; no need to round-trip through disk
+    buffer = io.BytesIO()
+    result.save(buffer, 'PNG')
 
-            # Find closest color (RGB distance only)
-            min_dist = float('inf')
-            closest = palette[0]
-            for color in palette:
-                dist = np.sum((pixel[:3].astype(float) - color[:3]) ** 2)
-                if dist < min_dist:
-                    min_dist = dist
-                    closest = color
-
-            result[y, x] = closest
-
-    # Save to temp file
-    result_img = Image.fromarray(result.astype('uint8'), 'RGBA')
-    temp_path = Path(tempfile.mktemp(suffix='.png'))
-    result_img.save(temp_path, 'PNG')
-
-    return temp_path
+    return buffer.getvalue()
 
 
 # Preset color palettes
 PALETTES = {
-    "manito": [
+    "manito": (
         (42, 157, 143, 255),    # Teal #2A9D8F
         (231, 111, 81, 255),    # Terracotta #E76F51
         (245, 240, 232, 255),   # Sand beige #F5F0E8
         (255, 255, 255, 255),   # White
-    ],
+    ),
 }
 
+# Default logo palette, used when no project palette is given
+DEFAULT_LOGO_PALETTE = (
+    (42, 157, 143, 255),    # Teal
+    (231, 111, 81, 255),    # Terracotta
+    (255, 255, 255, 255),   # White
+    (0, 0, 0, 255),         # Black
+)
+
 
 def convert_to_svg(
     input_path: Path,
@@ -156,52 +180,56 @@ def convert_to_svg(
         sys.exit(1)
 
     # Handle presets
-    temp_file = None
-    actual_input = input_path
+    quantized_png = None
 
     if preset == "logo" or palette:
         # Quantize colors for cleaner SVG
-        palette_colors = PALETTES.get(palette) if palette else None
-
-        if not palette_colors:
-            # Default logo palette: extract dominant colors or use generic
-            palette_colors = [
-                (42, 157, 143, 255),    # Teal
-                (231, 111, 81, 255),    # Terracotta
-                (255, 255, 255, 255),   # White
-                (0, 0, 0, 255),         # Black
-            ]
+        palette_colors = PALETTES.get(palette, DEFAULT_LOGO_PALETTE)
 
         print(f"  Quantizing to {len(palette_colors)} colors...")
-        temp_file = quantize_to_palette(input_path, palette_colors)
-        actual_input = temp_file
+        quantized_png = quantize_to_palette(input_path, palette_colors)
+        if quantized_png is None:
+            print("  Already uses palette colors, skipping quantization")
 
     # Ensure output has .svg extension
     output_path = output_path.with_suffix(".svg")
 
     # Create output directory if needed
-    output_path.parent.mkdir(parents=True, exist_ok=True)
+    if not output_path.parent.is_dir():
+        output_path.parent.mkdir(parents=True, exist_ok=True)
 
     print(f"Converting to SVG...")
     print(f"  Input: {input_path}")
     print(f"  Mode: {colormode}")
 
+    trace_options = dict(
+        colormode=colormode,
+        hierarchical=hierarchical,
+        mode=mode,
+        filter_speckle=filter_speckle,
+        color_precision=color_precision,
+        layer_difference=layer_difference,
+        corner_threshold=corner_threshold,
+        length_threshold=length_threshold,
+        max_iterations=max_iterations,
+        splice_threshold=splice_threshold,
+        path_precision=path_precision,
+    )
+
+    temp_file = None
     try:
-        vtracer.convert_image_to_svg_py(
-            str(actual_input),
-            str(output_path),
-            colormode=colormode,
-            hierarchical=hierarchical,
-            mode=mode,
-            filter_speckle=filter_speckle,
-            color_precision=color_precision,
-            layer_difference=layer_difference,
-            corner_threshold=corner_threshold,
-            length_threshold=length_threshold,
-            max_iterations=max_iterations,
-            splice_threshold=splice_threshold,
-            path_precision=path_precision,
-        )
+        if quantized_png is None:
+            vtracer.convert_image_to_svg_py(str(input_path), str(output_path), **trace_options)
+        elif hasattr(vtracer, "convert_raw_image_to_svg"):
+            # Trace the quantized image straight from memory
+            svg = vtracer.convert_raw_image_to_svg(quantized_png, img_format="png", **trace_options)
+            output_path.write_text(svg, encoding="utf-8")
+        else:
+            # Older vtracer only reads from disk
+            with tempfile.NamedTemporaryFile(suffix=".png", delete=False) as f:
+                f.write(quantized_png)
+                temp_file = Path(f.name)
+            vtracer.convert_image_to_svg_py(str(temp_file), str(output_path), **trace_options)
     except Exception as e:
         print(f"Error: SVG conversion failed: {e}", file=sys.stderr)
         sys.exit(1)
@@ -210,14 +238,15 @@ def convert_to_svg(
         if temp_file and temp_file.exists():
             temp_file.unlink()
 
-    if output_path.exists():
+    try:
         size_kb = output_path.stat().st_size / 1024
-        print(f"  Output: {output_path} ({size_kb:.1f} KB)")
-        return output_path
-    else:
+    except FileNotFoundError:
         print(f"Error: SVG file was not created", file=sys.stderr)
         sys.exit(1)
 
+    print(f"  Output: {output_path} ({size_kb:.1f} KB)")
+    return output_path
+
 
 def main():
     parser = argparse.ArgumentParser(
@@ -17,6 +17,15 @@ Usage:
     # Set max parallel workers (default: 4)
     python generate_batch.py --workers 6 jobs.json
 
+    # Stay under the account's rate limit (requests per minute)
+    python generate_batch.py --rpm 10 jobs.json
+
+    # Stop submitting jobs on the first auth or quota error
+    python generate_batch.py --fail-fast jobs.json
+
+    # Generate identical jobs (same prompt and inputs) once and copy the image
+    python generate_batch.py --dedupe jobs.json
+
 JSON format (RECOMMENDED - supports multiple inputs per job):
     {
         "preset": "mobile-ui,<project_preset>",
@@ -33,12 +42,15 @@ CLI format (simple jobs only - limited input support):
 Environment variables:
     GEMINI_API_KEY (required) - Your Google Gemini API key
     IMAGE_SIZE (optional) - Image size: "512", "1K" (default), or "2K"
+    GEMINI_RPM (optional) - Max requests per minute (default: unlimited)
 """
 
 import argparse
 import json
 import os
+import shutil
 import sys
+import threading
 import time
 from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
@@ -50,38 +62,124 @@ sys.path.insert(0, str(SCRIPT_DIR))
 from generate_image import (
     get_api_key,
     validate_image_size,
-    create_output_dir,
     build_request_body,
     make_api_request,
+    ApiError,
     extract_image_data,
     save_image,
+    finalize_output_path,
     get_file_size,
     load_input_image,
-    apply_unique_naming,
+    close_connections,
     DEFAULT_MODEL_ID,
     DEFAULT_IMAGE_SIZE,
 )
 from generate_with_preset import (
     load_presets,
-    build_prompt_with_presets,
+    build_preset_prefix,
 )
 
+# HTTP statuses that every remaining job would hit too: bad key, no access, quota
+FATAL_HTTP_STATUSES = {401, 403, 429}
+
+
+class RateLimiter:
+    """Space out request starts to stay under a requests-per-minute limit.
+
+    Thread-safe: each caller reserves the next free slot under a lock, then
+    sleeps outside it until that slot comes up.
+    """
+
+    def __init__(self, rpm: int):
+        self.interval = 60.0 / rpm
+        self.next_slot = time.monotonic()
+        self.lock = threading.Lock()
+
+    def wait(self) -> None:
+        """Block until this caller may send its request."""
+        with self.lock:
+            now = time.monotonic()
+            slot = max(self.next_slot, now)
+            self.next_slot = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+class ConcurrencyLimiter:
+    """Adaptive cap on in-flight API requests (additive increase, multiplicative decrease).
+
+    Starts at max_limit. An HTTP 429 halves the cap (once per burst: 429s
+    from requests sent before the last cut are ignored); after a full cap's
+    worth of consecutive successes it grows by one, back up to max_limit.
+    Any other failure (server errors, timeouts) restarts the success count.
+    """
+
+    def __init__(self, max_limit: int):
+        self.max_limit = max_limit
+        self.limit = max_limit
+        self.active = 0
+        self.successes = 0
+        self.epoch = 0
+        self.cond = threading.Condition()
+
+    def acquire(self) -> int:
+        """Block until a request slot is free under the current cap.
+
+        Returns a token to pass back to release().
+        """
+        with self.cond:
+            while self.active >= self.limit:
+                self.cond.wait()
+            self.active += 1
+            return self.epoch
+
+    def release(self, token: int, outcome: str) -> None:
+        """Free a request slot and adjust the cap from its outcome.
+
+        outcome is "success", "throttled" (HTTP 429) or "failed".
+        """
+        with self.cond:
+            self.active -= 1
+            if outcome == "throttled":
+                self.successes = 0
+                if token == self.epoch and self.limit > 1:
+                    self.epoch += 1
+                    self.limit //= 2
+                    print(f"Throttled (HTTP 429): reducing concurrency to {self.limit}")
+            elif outcome == "success":
+                if self.limit < self.max_limit:
+                    self.successes += 1
+                    if self.successes >= self.limit:
+                        self.successes = 0
+                        self.limit += 1
+            else:
+                self.successes = 0
+            self.cond.notify_all()
+
+
+def get_job_inputs(job: dict) -> list[str]:
+    """Return a job's input image paths ("input" or "inputs") as a list."""
+    input_paths = job.get("input", job.get("inputs", []))
+
+    # Normalize input_paths to list
+    if isinstance(input_paths, str):
+        input_paths = [input_paths]
+    return input_paths
+
 
 def generate_single(
     job: dict,
-    preset_content: str,
+    preset_prefix: str,
     api_key: str,
     model_id: str,
     image_size: str,
+    rate_limiter: RateLimiter | None = None,
+    concurrency: ConcurrencyLimiter | None = None,
 ) -> dict:
     """Generate a single image. Returns result dict with status and details."""
     prompt = job["prompt"]
     output_path = Path(job["output"])
-    input_paths = job.get("input", job.get("inputs", []))
-
-    # Normalize input_paths to list
-    if isinstance(input_paths, str):
-        input_paths = [input_paths]
+    input_paths = get_job_inputs(job)
 
     result = {
         "prompt": prompt,
@@ -92,23 +190,31 @@ def generate_single(
     start_time = time.time()
 
     try:
-        # Load input images if provided
+        # Input images are cached by load_input_image, so shared ones are encoded once
         input_images = None
         if input_paths:
-            input_images = []
-            for input_path_str in input_paths:
-                input_path = Path(input_path_str)
-                input_images.append(load_input_image(input_path))
+            input_images = [load_input_image(Path(p)) for p in input_paths]
 
         # Build full prompt with presets
-        full_prompt = build_prompt_with_presets(preset_content, prompt)
-
-        # Create output directory
-        create_output_dir(output_path)
+        full_prompt = preset_prefix + prompt
 
         # Build and send request
         request_body = build_request_body(full_prompt, image_size, input_images)
-        response = make_api_request(api_key, model_id, request_body)
+        if concurrency:
+            token = concurrency.acquire()
+        outcome = "failed"
+        try:
+            if rate_limiter:
+                rate_limiter.wait()
+            response = make_api_request(api_key, model_id, request_body)
+            outcome = "success"
+        except ApiError as e:
+            if e.status == 429:
+                outcome = "throttled"
+            raise
+        finally:
+            if concurrency:
+                concurrency.release(token, outcome)
 
         # Extract and save image
         image_data = extract_image_data(response)
@@ -126,6 +232,13 @@ def generate_single(
         result["size"] = get_file_size(final_path)
         result["elapsed"] = f"{elapsed:.1f}s"
 
+    except ApiError as e:
+        elapsed = time.time() - start_time
+        result["status"] = "error"
+        result["error"] = str(e)
+        result["http_status"] = e.status
+        result["elapsed"] = f"{elapsed:.1f}s"
+
     except Exception as e:
         elapsed = time.time() - start_time
         result["status"] = "error"
@@ -135,6 +248,32 @@ def generate_single(
     return result
 
 
+def copy_result(result: dict, job: dict) -> dict:
+    """Give a duplicate job its own copy of the image generated for an identical job."""
+    copy = {
+        "prompt": job["prompt"],
+        "output": job["output"],
+        "status": result["status"],
+    }
+    if result["status"] != "success":
+        copy["error"] = result.get("error", "Unknown")
+        return copy
+
+    source_path = Path(result["final_path"])
+    final_path = finalize_output_path(Path(job["output"]), source_path.suffix)
+    try:
+        shutil.copyfile(source_path, final_path)
+    except OSError as e:
+        copy["status"] = "error"
+        copy["error"] = str(e)
+        return copy
+
+    copy["final_path"] = str(final_path)
+    copy["size"] = result["size"]
+    copy["elapsed"] = f"copy of {source_path.name}"
+    return copy
+
+
 def run_batch(
     jobs: list[dict],
     preset: str | None,
@@ -142,61 +281,172 @@ def run_batch(
     api_key: str,
     model_id: str,
     image_size: str,
+    rpm: int | None = None,
+    fail_fast: bool = False,
+    dedupe: bool = False,
 ) -> list[dict]:
-    """Run multiple generation jobs in parallel. Returns list of results."""
+    """Run multiple generation jobs in parallel. Returns list of results.
+
+    Requests in flight are capped adaptively: the cap starts at max_workers,
+    halves on each HTTP 429 and creeps back up while requests succeed.
+
+    If rpm is set, request starts are spaced to stay under that many
+    requests per minute, regardless of the number of workers.
 
-    # Load presets once
+    If fail_fast is set, the first auth or quota error (HTTP 401/403/429)
+    cancels every job that has not started yet; those are reported as skipped.
+
+    If dedupe is set, jobs with the same prompt and inputs share a single API
+    call; each gets its own uniquely named copy of the image. Off by default,
+    since repeating a prompt is also how callers ask for variations.
+    """
+
+    # Load presets and build the shared prompt prefix once
     preset_content = ""
     if preset:
         preset_content = load_presets(preset)
+    preset_prefix = build_preset_prefix(preset_content)
+
+    # Check every input image before any worker starts, and note its size
+    # for request ordering. The images themselves are loaded by the workers
+    # through load_input_image's cache, so jobs sharing a reference (e.g.
+    # logo.png) don't re-read and re-encode it.
+    input_sizes: dict[str, int] = {}
+    for job in jobs:
+        for p in get_job_inputs(job):
+            if p not in input_sizes:
+                try:
+                    input_sizes[p] = os.path.getsize(p)
+                except OSError:
+                    print(f"Error: Input image not found: {p}", file=sys.stderr)
+                    sys.exit(1)
+
+    # Create each output directory once instead of once per job. A directory
+    # that can't be created fails only the jobs writing there.
+    dir_errors: dict[Path, str] = {}
+    for output_dir in {Path(job["output"]).parent for job in jobs}:
+        try:
+            output_dir.mkdir(parents=True, exist_ok=True)
+        except OSError as e:
+            dir_errors[output_dir] = str(e)
+
+    failed_results = []
+    runnable_jobs = []
+    for job in jobs:
+        output_dir = Path(job["output"]).parent
+        if output_dir in dir_errors:
+            failed_results.append({
+                "prompt": job["prompt"],
+                "output": job["output"],
+                "status": "error",
+                "error": f"Cannot create output directory: {dir_errors[output_dir]}",
+            })
+        else:
+            runnable_jobs.append(job)
+
+    # Group jobs that send the same request; without dedupe every job is its own group
+    groups: dict[object, list[dict]] = {}
+    for index, job in enumerate(runnable_jobs):
+        key = (job["prompt"], tuple(get_job_inputs(job))) if dedupe else index
+        groups.setdefault(key, []).append(job)
+
+    # Submit the most expensive requests first (largest input payload, then
+    # longest prompt) so they overlap with cheap ones instead of straggling
+    # at the end. Image size is batch-wide, so it doesn't affect the order.
+    def request_cost(group: list[dict]) -> tuple[int, int]:
+        job = group[0]
+        input_size = sum(input_sizes[p] for p in get_job_inputs(job))
+        return input_size, len(job["prompt"])
+
+    ordered_groups = sorted(groups.values(), key=request_cost, reverse=True)
 
     results = []
     total = len(jobs)
 
+    # Never spin up more threads than there are API calls to make
+    max_workers = max(1, min(max_workers, len(groups)))
+
     print(f"Starting batch generation: {total} images, {max_workers} parallel workers")
+    if len(groups) < len(runnable_jobs):
+        print(f"Deduplicated: {len(groups)} API requests")
     if preset:
         print(f"Preset: {preset}")
     print(f"Model: {model_id}, Size: {image_size}")
+    if rpm:
+        print(f"Rate limit: {rpm} requests/min")
     print()
 
+    completed = 0
+    for result in failed_results:
+        completed += 1
+        results.append(result)
+        print(f"[{completed}/{total}] ✗ {result['output']} - ERROR: {result['error']}")
+
+    rate_limiter = RateLimiter(rpm) if rpm else None
+    concurrency = ConcurrencyLimiter(max_workers)
+
     start_time = time.time()
 
     with ThreadPoolExecutor(max_workers=max_workers) as executor:
-        # Submit all jobs
-        future_to_job = {
+        # Submit one job per group; its duplicates are filled in from its result
+        future_to_group = {
             executor.submit(
                 generate_single,
-                job,
-                preset_content,
+                group[0],
+                preset_prefix,
                 api_key,
                 model_id,
                 image_size,
-            ): job
-            for job in jobs
+                rate_limiter,
+                concurrency,
+            ): group
+            for group in ordered_groups
         }
 
         # Process completed jobs as they finish
-        completed = 0
-        for future in as_completed(future_to_job):
-            completed += 1
+        aborted = False
+        for future in as_completed(future_to_group):
+            group = future_to_group[future]
+            if future.cancelled():
+                for job in group:
+                    completed += 1
+                    results.append({"prompt": job["prompt"], "output": job["output"], "status": "skipped"})
+                continue
+
             result = future.result()
-            results.append(result)
 
-            # Print progress
-            status_icon = "✓" if result["status"] == "success" else "✗"
-            elapsed = result.get("elapsed", "")
-            if result["status"] == "success":
-                print(f"[{completed}/{total}] {status_icon} {result['final_path']} ({result['size']}, {elapsed})")
-            else:
-                print(f"[{completed}/{total}] {status_icon} {result['output']} - ERROR: {result.get('error', 'Unknown')}")
+            if fail_fast and not aborted and result.get("http_status") in FATAL_HTTP_STATUSES:
+                # Jobs already running finish; queued ones are dropped
+                aborted = True
+                cancelled = sum(len(group) for f, group in future_to_group.items() if not f.done() and f.cancel())
+                print(f"Fail-fast: HTTP {result['http_status']}, skipping {cancelled} pending jobs")
+
+            for result in [result] + [copy_result(result, duplicate) for duplicate in group[1:]]:
+                completed += 1
+                results.append(result)
+
+                # Print progress
+                status_icon = "✓" if result["status"] == "success" else "✗"
+                elapsed = result.get("elapsed", "")
+                if result["status"] == "success":
+                    print(f"[{completed}/{total}] {status_icon} {result['final_path']} ({result['size']}, {elapsed})")
+                else:
+                    print(f"[{completed}/{total}] {status_icon} {result['output']} - ERROR: {result.get('error', 'Unknown')}")
+
+        # All jobs are done; release the workers' kept-alive sockets
+        close_connections()
 
     total_elapsed = time.time() - start_time
 
     # Summary
     print()
     successful = sum(1 for r in results if r["status"] == "success")
-    failed = total - successful
-    print(f"Batch complete: {successful} succeeded, {failed} failed, {total_elapsed:.1f}s total")
+    skipped = sum(1 for r in results if r["status"] == "skipped")
+    failed = total - successful - skipped
+    summary = f"Batch complete: {successful} succeeded, {failed} failed"
+    if skipped:
+        summary += f", {skipped} skipped"
+    print(f"{summary}, {total_elapsed:.1f}s total")
 
     return results
 
@@ -262,6 +512,9 @@ def main():
     workers = 4
     size = None
     model = None
+    rpm = None
+    fail_fast = False
+    dedupe = False
     cli_args = []
     
     i = 1
@@ -296,6 +549,18 @@ def main():
                 sys.exit(1)
             model = sys.argv[i + 1]
             i += 2
+        elif arg == "--rpm":
+            if i + 1 >= len(sys.argv):
+                print("Error: Missing requests per minute", file=sys.stderr)
+                sys.exit(1)
+            rpm = sys.argv[i + 1]
+            i += 2
+        elif arg == "--fail-fast":
+            fail_fast = True
+            i += 1
+        elif arg == "--dedupe":
+            dedupe = True
+            i += 1
         elif arg.startswith("--"):
             # Pass through to CLI parser (like --output, --input)
             cli_args.append(arg)
@@ -318,6 +583,9 @@ def main():
         print("  --workers N       Max parallel workers (default: 4)")
         print("  --size SIZE       Image size: 512, 1K, 2K")
         print("  --model MODEL     Gemini model ID")
+        print("  --rpm N           Max requests per minute (default: $GEMINI_RPM or unlimited)")
+        print("  --fail-fast       Skip pending jobs after an auth or quota error (HTTP 401/403/429)")
+        print("  --dedupe          Generate identical jobs once and copy the image")
         print("\nExamples:")
         print("  # JSON (RECOMMENDED)")
         print("  python generate_batch.py jobs.json")
@@ -330,6 +598,15 @@ def main():
     model_id = model or os.environ.get("GEMINI_MODEL", DEFAULT_MODEL_ID)
     image_size = size or os.environ.get("IMAGE_SIZE", DEFAULT_IMAGE_SIZE)
     image_size = validate_image_size(image_size)
+    rpm = rpm or os.environ.get("GEMINI_RPM")
+    if rpm is not None:
+        try:
+            rpm = int(rpm)
+        except ValueError:
+            print("Error: Requests per minute must be a number", file=sys.stderr)
+            sys.exit(1)
+        if rpm <= 0:
+            rpm = None
 
     # Determine if input is JSON file or CLI pairs
     jobs = []
@@ -364,6 +641,9 @@ def main():
         api_key=api_key,
         model_id=model_id,
         image_size=image_size,
+        rpm=rpm,
+        fail_fast=fail_fast,
+        dedupe=dedupe,
     )
 
     # Exit with error code if any failed
@@ -16,22 +16,33 @@ Environment variables:
 
 import argparse
 import base64
+import binascii
+import functools
+import http.client
 import json
+import mmap
 import os
-import random
-import string
+import select
+import ssl
 import sys
+import threading
+import urllib.parse
 import urllib.request
-import urllib.error
+import weakref
 from pathlib import Path
 
+from imagen_defaults import DEFAULT_MODEL_ID
+
 
 # Configuration
-DEFAULT_MODEL_ID = "gemini-3.1-flash-image-preview"
 API_BASE_URL = "https://generativelanguage.googleapis.com/v1beta/models"
 DEFAULT_IMAGE_SIZE = "1K"
+REQUEST_TIMEOUT = 120
 VALID_SIZES = {"512", "1K", "2K"}
 
+# Input images larger than this are memory-mapped instead of read
+MMAP_THRESHOLD = 1024 * 1024
+
 # Magic bytes for image format detection
 MAGIC_BYTES = {
     b'\xff\xd8\xff': '.jpg',      # JPEG
@@ -41,39 +52,47 @@ MAGIC_BYTES = {
     b'RIFF': '.webp',             # WebP (starts with RIFF, then WEBP)
 }
 
+# Magic bytes grouped by first byte, so detection is a single dict lookup
+# followed by at most two prefix checks
+MAGIC_BY_FIRST_BYTE: dict[int, list[tuple[bytes, str]]] = {}
+for _magic, _ext in MAGIC_BYTES.items():
+    MAGIC_BY_FIRST_BYTE.setdefault(_magic[0], []).append((_magic, _ext))
+
 # Unique ID configuration
 UNIQUE_ID_LENGTH = 4
-UNIQUE_ID_CHARS = string.ascii_lowercase + string.digits  # a-z, 0-9
 
 
-def generate_unique_id(length: int = UNIQUE_ID_LENGTH) -> str:
-    """Generate a random unique ID (e.g., 'a3xz')."""
-    return ''.join(random.choices(UNIQUE_ID_CHARS, k=length))
+class ApiError(Exception):
+    """An API request failed; status is the HTTP status code, or None if no response arrived."""
 
+    def __init__(self, message: str, status: int | None = None):
+        super().__init__(message)
+        self.status = status
 
-def apply_unique_naming(output_path: Path) -> Path:
-    """Apply unique naming convention: ${contextual_name}_${4 letter ID}.ext
 
-    Examples:
-        home.jpg -> home_a3xz.jpg
-        profile-screen.png -> profile-screen_b2wy.png
-        output.jpg -> output_c4km.jpg
+def generate_unique_id(length: int = UNIQUE_ID_LENGTH) -> str:
+    """Generate a random unique ID (e.g., 'a3xz').
+
+    Base32 of os.urandom: lowercase a-z and 2-7, 5 bits per character.
     """
-    stem = output_path.stem
-    suffix = output_path.suffix
-    unique_id = generate_unique_id()
-    new_name = f"{stem}_{unique_id}{suffix}"
-    return output_path.with_name(new_name)
+    random_bytes = os.urandom((length * 5 + 7) // 8)
+    return base64.b32encode(random_bytes)[:length].decode("ascii").lower()
 
 
-def detect_image_format(image_bytes: bytes) -> str:
-    """Detect image format from magic bytes. Returns extension (e.g., '.jpg')."""
-    for magic, ext in MAGIC_BYTES.items():
-        if image_bytes.startswith(magic):
+def detect_image_format(image_bytes: bytes | memoryview) -> str:
+    """Detect image format from magic bytes. Returns extension (e.g., '.jpg').
+
+    Looks up the MAGIC_BYTES signatures sharing the first byte, then compares
+    memoryview slices so the header is never copied out of the (possibly
+    large) buffer.
+    """
+    mv = memoryview(image_bytes)
+    candidates = MAGIC_BY_FIRST_BYTE.get(mv[0], ()) if mv else ()
+    for magic, ext in candidates:
+        if mv[:len(magic)] == magic:
             # Special case for WebP: verify WEBP signature
-            if magic == b'RIFF' and len(image_bytes) >= 12:
-                if image_bytes[8:12] != b'WEBP':
-                    continue
+            if magic == b'RIFF' and len(mv) >= 12 and mv[8:12] != b'WEBP':
+                continue
             return ext
     # Default to JPEG if unknown (current Gemini behavior)
     return '.jpg'
@@ -84,6 +103,77 @@ def get_api_endpoint(model_id: str) -> str:
     return f"{API_BASE_URL}/{model_id}:streamGenerateContent"
 
 
+# Keep-alive connection per thread, so repeated requests (e.g. batch workers)
+# skip the TCP + TLS handshake. http.client connections are not thread-safe.
+_thread_local = threading.local()
+_open_connections = weakref.WeakSet()
+_open_connections_lock = threading.Lock()
+
+
+@functools.lru_cache(maxsize=None)
+def get_ssl_context() -> ssl.SSLContext:
+    """Build the TLS context shared by all API connections.
+
+    Created once, so CA certificates are loaded once per process rather
+    than once per connection.
+    """
+    context = ssl.create_default_context()
+    context.set_alpn_protocols(["http/1.1"])
+    return context
+
+
+def get_proxy() -> urllib.parse.SplitResult | None:
+    """Return the HTTPS proxy configured for the API host, if any.
+
+    Honours the same environment and system settings as urllib
+    (https_proxy, no_proxy).
+    """
+    proxy = urllib.request.getproxies().get("https")
+    if not proxy or urllib.request.proxy_bypass(urllib.parse.urlsplit(API_BASE_URL).hostname):
+        return None
+    if "://" not in proxy:
+        proxy = f"http://{proxy}"
+    return urllib.parse.urlsplit(proxy)
+
+
+def get_connection() -> http.client.HTTPSConnection:
+    """Get this thread's keep-alive connection to the API host.
+
+    When an HTTPS proxy is configured, the connection is tunnelled
+    through it with CONNECT.
+    """
+    conn = getattr(_thread_local, "connection", None)
+    if conn is None:
+        api = urllib.parse.urlsplit(API_BASE_URL)
+        proxy = get_proxy()
+        if proxy is None:
+            conn = http.client.HTTPSConnection(api.netloc, timeout=REQUEST_TIMEOUT, context=get_ssl_context())
+        else:
+            conn = http.client.HTTPSConnection(
+                proxy.hostname, proxy.port or 80, timeout=REQUEST_TIMEOUT, context=get_ssl_context()
+            )
+            tunnel_headers = {}
+            if proxy.username:
+                credentials = urllib.parse.unquote(proxy.username) + ":" + urllib.parse.unquote(proxy.password or "")
+                tunnel_headers["Proxy-Authorization"] = "Basic " + base64.b64encode(credentials.encode()).decode("ascii")
+            conn.set_tunnel(api.hostname, api.port or 443, headers=tunnel_headers)
+        _thread_local.connection = conn
+        with _open_connections_lock:
+            _open_connections.add(conn)
+    return conn
+
+
+def close_connections() -> None:
+    """Close every keep-alive connection opened by get_connection().
+
+    Closed connections reconnect transparently if used again.
+    """
+    with _open_connections_lock:
+        connections = list(_open_connections)
+    for conn in connections:
+        conn.close()
+
+
 def get_api_key() -> str:
     """Get the Gemini API key from environment variable."""
     api_key = os.environ.get("GEMINI_API_KEY")
@@ -104,18 +194,32 @@ def validate_image_size(size: str) -> str:
     return size
 
 
-def fix_extension(output_path: Path, detected_ext: str) -> Path:
-    """Fix extension to match detected image format."""
-    current_ext = output_path.suffix.lower()
+def finalize_output_path(output_path: Path, detected_ext: str, apply_unique_id: bool = True) -> Path:
+    """Apply unique naming and fix the extension to match the image data.
+
+    Unique naming convention: ${contextual_name}_${4 letter ID}.ext
+
+    Examples:
+        home.jpg -> home_a3xz.jpg
+        profile-screen.png -> profile-screen_b2wy.png
+        output.jpeg (PNG data) -> output_c4km.png
+    """
+    stem = output_path.stem
+    suffix = output_path.suffix
+    current_ext = suffix.lower()
     # Normalize .jpeg to .jpg for comparison
     if current_ext == '.jpeg':
         current_ext = '.jpg'
     if current_ext != detected_ext:
-        new_path = output_path.with_suffix(detected_ext)
-        if output_path.suffix:
+        if suffix:
             print(f"Note: Changed extension to {detected_ext} (detected from image data)", file=sys.stderr)
-        return new_path
-    return output_path
+        suffix = detected_ext
+
+    # Apply unique naming convention: ${contextual_name}_${4 letter ID}.ext
+    if apply_unique_id:
+        stem = f"{stem}_{generate_unique_id()}"
+
+    return output_path.with_name(stem + suffix)
 
 
 def create_output_dir(output_path: Path) -> None:
@@ -125,17 +229,41 @@ def create_output_dir(output_path: Path) -> None:
         output_dir.mkdir(parents=True, exist_ok=True)
 
 
-def load_input_image(image_path: Path) -> tuple[str, str]:
-    """Load an image file and return (base64_data, mime_type)."""
-    if not image_path.exists():
+def load_input_image(image_path: Path) -> tuple[bytes, str]:
+    """Load an image file and return (base64_data, mime_type).
+
+    The base64 data is ASCII bytes, ready to inline into the request body.
+
+    Cached per file version (path and modification time), so an image used
+    several times is only read and encoded once. The cache keeps the most
+    recently used images only, bounding memory on large batches.
+    """
+    try:
+        mtime_ns = os.stat(image_path).st_mtime_ns
+    except FileNotFoundError:
         print(f"Error: Input image not found: {image_path}", file=sys.stderr)
         sys.exit(1)
 
-    image_bytes = image_path.read_bytes()
-    base64_data = base64.b64encode(image_bytes).decode("utf-8")
+    return _load_input_image(os.path.abspath(image_path), mtime_ns)
+
+
+@functools.lru_cache(maxsize=32)
+def _load_input_image(path: str, mtime_ns: int) -> tuple[bytes, str]:
+    """Read and encode an image file; mtime_ns is only part of the cache key."""
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size > MMAP_THRESHOLD:
+            # Encode large files straight from the page cache, without
+            # copying them into a bytes object first
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                base64_data = binascii.b2a_base64(mm, newline=False)
+                header = mm[:16]
+        else:
+            image_bytes = f.read()
+            base64_data = binascii.b2a_base64(image_bytes, newline=False)
+            header = image_bytes[:16]
 
     # Detect MIME type from magic bytes
-    ext = detect_image_format(image_bytes)
+    ext = detect_image_format(header)
     mime_types = {
         ".jpg": "image/jpeg",
         ".png": "image/png",
@@ -147,9 +275,13 @@ def load_input_image(image_path: Path) -> tuple[str, str]:
     return base64_data, mime_type
 
 
-def build_request_body(prompt: str, image_size: str, input_images: list[tuple[str, str]] | None = None) -> bytes:
+def build_request_body(prompt: str, image_size: str, input_images: list[tuple[bytes, str]] | None = None) -> bytes:
     """Build the JSON request body for the API.
 
+    The body is assembled as bytes around a cached serialization of the
+    request scaffold: base64 image data goes in as-is, without a round trip
+    through str and the JSON encoder, and only the prompt is JSON-encoded.
+
     Args:
         prompt: Text prompt for generation
         image_size: Output image size (512, 1K, 2K)
@@ -157,24 +289,28 @@ def build_request_body(prompt: str, image_size: str, input_images: list[tuple[st
     """
     parts = []
 
-    # Add input images first if provided (image-to-image mode)
+    # Add input images first if provided (image-to-image mode). Base64 is
+    # plain ASCII with nothing to escape, so it can be inlined directly.
     if input_images:
         for base64_data, mime_type in input_images:
-            parts.append({
-                "inlineData": {
-                    "mimeType": mime_type,
-                    "data": base64_data
-                }
-            })
+            parts.append(b'{"inlineData": {"mimeType": %s, "data": "%s"}}' % (json.dumps(mime_type).encode("utf-8"), base64_data))
 
     # Add text prompt
-    parts.append({"text": prompt})
+    parts.append(b'{"text": %s}' % json.dumps(prompt).encode("utf-8"))
+
+    head, tail = _request_template(image_size)
+    return b"".join((head, b", ".join(parts), tail))
 
+
+@functools.lru_cache(maxsize=None)
+def _request_template(image_size: str) -> tuple[bytes, bytes]:
+    """Serialize the request structure once, split around the contents of its parts list."""
+    placeholder = "\0parts\0"
     request_data = {
         "contents": [
             {
                 "role": "user",
-                "parts": parts
+                "parts": [placeholder]
             }
         ],
         "generationConfig": {
@@ -184,36 +320,62 @@ def build_request_body(prompt: str, image_size: str, input_images: list[tuple[st
             }
         }
     }
-    return json.dumps(request_data).encode("utf-8")
+    head, tail = json.dumps(request_data).split(json.dumps(placeholder))
+    return head.encode("utf-8"), tail.encode("utf-8")
 
 
 def make_api_request(api_key: str, model_id: str, request_body: bytes) -> dict:
-    """Make the API request and return the response."""
+    """Make the API request and return the response.
+
+    Raises:
+        ApiError: If the request could not be sent or the API returned an error status
+    """
     endpoint = get_api_endpoint(model_id)
-    url = f"{endpoint}?key={api_key}"
+    path = f"{urllib.parse.urlsplit(endpoint).path}?key={api_key}"
 
     headers = {
         "Content-Type": "application/json"
     }
 
-    req = urllib.request.Request(url, data=request_body, headers=headers, method="POST")
+    conn = get_connection()
+    if conn.sock is not None and select.select([conn.sock], [], [], 0)[0]:
+        # An idle keep-alive connection has nothing to read unless the
+        # server closed it; reconnect before sending rather than after
+        conn.close()
+
+    for attempt in range(2):
+        reused = conn.sock is not None
+        try:
+            conn.request("POST", path, body=request_body, headers=headers)
+            break
+        except (http.client.HTTPException, OSError) as e:
+            conn.close()
+            # The request never reached the server, so it is safe to retry once
+            # when a kept-alive connection turns out to be stale
+            if reused and attempt == 0 and isinstance(e, ConnectionError):
+                continue
+            raise ApiError(f"Failed to connect to API: {e}") from e
 
     try:
-        with urllib.request.urlopen(req, timeout=120) as response:
-            return json.loads(response.read().decode("utf-8"))
-    except urllib.error.HTTPError as e:
-        error_body = e.read().decode("utf-8") if e.fp else ""
-        print(f"Error: API request failed with HTTP status {e.code}", file=sys.stderr)
+        response = conn.getresponse()
+        response_body = response.read()
+    except (http.client.HTTPException, OSError) as e:
+        conn.close()
+        # Not retried: the server may already be generating (and billing) the image
+        raise ApiError(f"Failed to connect to API: {e}") from e
+
+    if response.status >= 400:
+        error_body = response_body.decode("utf-8", errors="replace")
         if error_body:
             try:
                 error_json = json.loads(error_body)
                 print(f"Response: {json.dumps(error_json, indent=2)}", file=sys.stderr)
             except json.JSONDecodeError:
                 print(f"Response: {error_body}", file=sys.stderr)
-        sys.exit(1)
-    except urllib.error.URLError as e:
-        print(f"Error: Failed to connect to API: {e.reason}", file=sys.stderr)
-        sys.exit(1)
+        raise ApiError(f"API request failed with HTTP status {response.status}", response.status)
+
+    # json.loads takes the raw bytes and detects the encoding itself
+    return json.loads(response_body)
 
 
 def extract_image_data(response: dict) -> str:
@@ -241,6 +403,26 @@ def extract_image_data(response: dict) -> str:
         sys.exit(1)
 
 
+def write_file(path: Path, data: bytes) -> None:
+    """Write data to a file, reserving its full size up front where supported.
+
+    Preallocating tells the filesystem the final size before any data
+    lands, so the file is laid out in one extent with a single size update.
+    """
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC | getattr(os, "O_BINARY", 0), 0o666)
+    try:
+        if data and hasattr(os, "posix_fallocate"):
+            try:
+                os.posix_fallocate(fd, 0, len(data))
+            except OSError:
+                pass  # Not supported by this filesystem; write normally
+        view = memoryview(data)
+        while view:
+            view = view[os.write(fd, view):]
+    finally:
+        os.close(fd)
+
+
 def save_image(image_data: str, output_path: Path, apply_unique_id: bool = True) -> Path:
     """Decode, detect format, apply unique naming, fix extension, and save the image.
 
@@ -253,16 +435,14 @@ def save_image(image_data: str, output_path: Path, apply_unique_id: bool = True)
         Final path where the image was saved
     """
     try:
-        image_bytes = base64.b64decode(image_data)
+        # a2b_base64 accepts the ASCII str as-is; b64decode would first copy
+        # it into a bytes object
+        image_bytes = binascii.a2b_base64(image_data)
         detected_ext = detect_image_format(image_bytes)
 
-        # Apply unique naming convention: ${contextual_name}_${4 letter ID}.ext
-        if apply_unique_id:
-            output_path = apply_unique_naming(output_path)
-
-        # Fix extension to match detected format
-        final_path = fix_extension(output_path, detected_ext)
-        final_path.write_bytes(image_bytes)
+        # Unique name and extension matching the detected format
+        final_path = finalize_output_path(output_path, detected_ext, apply_unique_id)
+        write_file(final_path, image_bytes)
         return final_path
     except Exception as e:
         print(f"Error: Failed to save image: {e}", file=sys.stderr)
@@ -271,7 +451,11 @@ def save_image(image_data: str, output_path: Path, apply_unique_id: bool = True)
 
 def get_file_size(path: Path) -> str:
     """Get human-readable file size."""
-    size = path.stat().st_size
+    return format_size(path.stat().st_size)
+
+
+def format_size(size: float) -> str:
+    """Format a byte count as a human-readable size."""
     for unit in ["B", "KB", "MB", "GB"]:
         if size < 1024:
             return f"{size:.1f} {unit}"
@@ -326,7 +510,11 @@ Environment Variables:
 
     # Build and send request
     request_body = build_request_body(args.prompt, image_size)
-    response = make_api_request(api_key, model_id, request_body)
+    try:
+        response = make_api_request(api_key, model_id, request_body)
+    except ApiError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        sys.exit(1)
 
     # Extract and save image
     image_data = extract_image_data(response)
@@ -337,12 +525,15 @@ Environment Variables:
     # Save image (detects format and fixes extension if needed)
     final_path = save_image(image_data, output_path)
 
-    # Verify and report success
-    if final_path.exists() and final_path.stat().st_size > 0:
-        file_size = get_file_size(final_path)
+    # Verify and report success (one stat for both the check and the size)
+    try:
+        saved_size = os.stat(final_path).st_size
+    except FileNotFoundError:
+        saved_size = 0
+    if saved_size > 0:
         print("Success! Image generated and saved.")
         print(f"File: {final_path}")
-        print(f"Size: {file_size}")
+        print(f"Size: {format_size(saved_size)}")
     else:
         print(f"Error: Failed to save image to {final_path}", file=sys.stderr)
         sys.exit(1)
@@ -39,55 +39,47 @@ Environment variables:
 """
 
 import argparse
+import functools
 import os
 import sys
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
 # Add parent directory to path for importing generate_image
 SCRIPT_DIR = Path(__file__).parent
 sys.path.insert(0, str(SCRIPT_DIR))
 
-from generate_image import (
-    get_api_key,
-    validate_image_size,
-    create_output_dir,
-    build_request_body,
-    make_api_request,
-    extract_image_data,
-    save_image,
-    get_file_size,
-    load_input_image,
-    apply_unique_naming,
-    DEFAULT_MODEL_ID,
-    DEFAULT_IMAGE_SIZE,
-)
-from convert_to_svg import convert_to_svg
-from remove_white_bg import remove_white_background
+from imagen_defaults import DEFAULT_MODEL_ID
+
+# Presets shipped with the skill; any other preset is a project preset
+BUILTIN_PRESETS = frozenset({"creative", "mobile-ui"})
 
 
 def get_preset_dirs() -> list[Path]:
     """Get list of directories to search for presets, in priority order."""
-    dirs = []
+    return list(_get_preset_dirs(os.getcwd(), os.environ.get("IMAGEN_PRESETS_DIR")))
+
+
+@functools.lru_cache(maxsize=4)
+def _get_preset_dirs(cwd: str, env_dir: str | None) -> tuple[Path, ...]:
+    """Probe the preset directories once per working directory and IMAGEN_PRESETS_DIR.
+
+    Works on plain strings; only the directories that exist become Paths.
+    """
+    candidates = []
 
     # 1. Current working directory presets (check multiple common locations)
     for subdir in ["code/docs/presets", "docs/presets", "design/presets", "presets"]:
-        cwd_presets = Path.cwd() / subdir
-        if cwd_presets.is_dir():
-            dirs.append(cwd_presets)
+        candidates.append(os.path.join(cwd, subdir))
 
     # 2. Environment variable
-    env_dir = os.environ.get("IMAGEN_PRESETS_DIR")
     if env_dir:
-        env_path = Path(env_dir)
-        if env_path.is_dir():
-            dirs.append(env_path)
+        candidates.append(env_dir)
 
     # 3. Built-in presets (relative to this script)
-    builtin = SCRIPT_DIR.parent / "presets"
-    if builtin.is_dir():
-        dirs.append(builtin)
+    candidates.append(os.path.join(os.path.dirname(SCRIPT_DIR), "presets"))
 
-    return dirs
+    return tuple(Path(d) for d in candidates if os.path.isdir(d))
 
 
 def find_preset(name: str) -> Path | None:
@@ -95,14 +87,53 @@ def find_preset(name: str) -> Path | None:
     # Allow both "name" and "name.txt"
     filename = name if name.endswith(".txt") else f"{name}.txt"
 
-    for preset_dir in get_preset_dirs():
-        preset_path = preset_dir / filename
-        if preset_path.is_file():
-            return preset_path
+    preset_dirs = tuple(get_preset_dirs())
+    preset_path = _preset_index(preset_dirs).get(filename)
+    if preset_path:
+        return preset_path
+
+    # Not a plain file name in the index (e.g. "brand/colors", or different
+    # case on a case-insensitive filesystem): probe the directories directly
+    for preset_dir in preset_dirs:
+        preset_path = os.path.join(preset_dir, filename)
+        if os.path.isfile(preset_path):
+            return Path(preset_path)
 
     return None
 
 
+@functools.lru_cache(maxsize=4)
+def _preset_index(preset_dirs: tuple[Path, ...]) -> dict[str, Path]:
+    """Map each preset file name to its highest-priority path.
+
+    Built from one scan per directory, so each lookup is a dict access
+    instead of an is_file() probe per directory.
+    """
+    index = {}
+    for preset_dir in preset_dirs:
+        for filename, path in _scan_preset_dir(preset_dir):
+            index.setdefault(filename, Path(path))
+    return index
+
+
+@functools.lru_cache(maxsize=16)
+def _scan_preset_dir(preset_dir: Path) -> tuple[tuple[str, str], ...]:
+    """Return (file name, path) for each .txt file in a preset directory.
+
+    Cached, so listing presets and resolving them share a single scandir
+    per directory. DirEntry carries the file type, so no extra stat per entry.
+    """
+    try:
+        with os.scandir(preset_dir) as entries:
+            return tuple(
+                (entry.name, entry.path)
+                for entry in entries
+                if entry.name.endswith(".txt") and entry.is_file()
+            )
+    except OSError:
+        return ()
+
+
 def load_preset(name: str) -> str:
     """Load preset content by name. Exits if not found."""
     preset_path = find_preset(name)
@@ -115,18 +146,26 @@ def load_preset(name: str) -> str:
     return preset_path.read_text(encoding="utf-8").strip()
 
 
-def load_presets(preset_names: str) -> str:
-    """Load and combine multiple presets (comma-separated). Returns combined text."""
-    names = [n.strip() for n in preset_names.split(",") if n.strip()]
+def parse_preset_names(preset_names: str) -> list[str]:
+    """Split a comma-separated preset list into names, dropping blanks."""
+    return [n.strip() for n in preset_names.split(",") if n.strip()]
+
+
+def load_presets(preset_names: str | list[str]) -> str:
+    """Load and combine multiple presets (comma-separated or already parsed). Returns combined text."""
+    names = parse_preset_names(preset_names) if isinstance(preset_names, str) else preset_names
     if not names:
         return ""
 
-    contents = []
-    for name in names:
-        content = load_preset(name)
-        contents.append(f"# Preset: {name}\n{content}")
+    # Read several presets concurrently, so slow (e.g. network) filesystems
+    # cost one file's latency instead of the sum; map() keeps the order
+    if len(names) > 1:
+        with ThreadPoolExecutor(max_workers=min(8, len(names))) as executor:
+            preset_texts = list(executor.map(load_preset, names))
+    else:
+        preset_texts = [load_preset(names[0])]
 
-    return "\n\n".join(contents)
+    return "\n\n".join(f"# Preset: {name}\n{content}" for name, content in zip(names, preset_texts))
 
 
 def list_presets() -> None:
@@ -138,62 +177,77 @@ def list_presets() -> None:
         print("\nCreate a 'presets/' folder in your project or set IMAGEN_PRESETS_DIR.")
         return
 
-    print("Available presets:\n")
+    # Collect the listing and write it once, instead of a print() (and, on a
+    # terminal, a write syscall) per line
+    lines = ["Available presets:", ""]
 
     seen = set()
     for preset_dir in preset_dirs:
-        presets = sorted(preset_dir.glob("*.txt"))
+        presets = sorted((filename[:-4], path) for filename, path in _scan_preset_dir(preset_dir))
         if presets:
-            print(f"  {preset_dir}/")
-            for p in presets:
-                name = p.stem
+            lines.append(f"  {preset_dir}/")
+            for name, path in presets:
                 if name not in seen:
-                    # Show first line as description
-                    first_line = p.read_text(encoding="utf-8").split("\n")[0][:60]
-                    print(f"    {name:20} {first_line}...")
+                    # Show first line as description; 256 bytes covers 60 characters
+                    with open(path, "rb") as f:
+                        first_line = f.readline(256).decode("utf-8", "replace").rstrip("\r\n")[:60]
+                    lines.append(f"    {name:20} {first_line}...")
                     seen.add(name)
-            print()
+            lines.append("")
 
+    sys.stdout.write("\n".join(lines) + "\n")
 
-def build_prompt_with_presets(preset_content: str, user_prompt: str) -> str:
-    """Combine preset instructions with user prompt."""
+
+@functools.lru_cache(maxsize=8)
+def build_preset_prefix(preset_content: str) -> str:
+    """Build the text that precedes the user prompt. Empty if no presets.
+
+    Cached, so every prompt built from the same presets shares one prefix
+    string and only the user prompt is appended per call.
+    """
     if not preset_content:
-        return user_prompt
+        return ""
 
     return f"""{preset_content}
 
 ---
 
 USER REQUEST:
-{user_prompt}"""
+"""
+
+
+def build_prompt_with_presets(preset_content: str, user_prompt: str) -> str:
+    """Combine preset instructions with user prompt."""
+    return build_preset_prefix(preset_content) + user_prompt
 
 
 def remove_background(input_path: Path, output_path: Path) -> Path:
     """Remove background from image using rembg. Returns output path."""
+    from generate_image import write_file
+
     try:
         from rembg import remove
-        from PIL import Image
     except ImportError:
         print("Error: rembg not installed. Install with: pip install rembg", file=sys.stderr)
         sys.exit(1)
 
     print("Removing background...")
 
-    # Load image
-    input_image = Image.open(input_path)
-
-    # Remove background
-    output_image = remove(input_image)
+    # Remove background; given encoded bytes, rembg returns PNG bytes
+    output_bytes = remove(input_path.read_bytes())
 
     # Ensure output is PNG for transparency
     final_path = output_path.with_suffix(".png")
 
-    # Save with transparency
-    output_image.save(final_path, "PNG")
+    # Save with transparency, in one preallocated write like save_image
+    write_file(final_path, output_bytes)
 
     # Remove original if different from output
-    if input_path != final_path and input_path.exists():
-        input_path.unlink()
+    if input_path != final_path:
+        try:
+            os.unlink(input_path)
+        except FileNotFoundError:
+            pass
 
     return final_path
 
@@ -276,11 +330,12 @@ Preset search order:
 
     # Load presets
     preset_content = ""
-    if args.preset:
-        preset_content = load_presets(args.preset)
+    preset_names = parse_preset_names(args.preset) if args.preset else []
+    if preset_names:
+        preset_content = load_presets(preset_names)
 
     # Build full prompt
-    full_prompt = build_prompt_with_presets(preset_content, args.prompt)
+    full_prompt = build_preset_prefix(preset_content) + args.prompt if preset_content else args.prompt
 
     # Handle --show-prompt
     if args.show_prompt:
@@ -291,6 +346,22 @@ Preset search order:
         print("=" * 60)
         return
 
+    # Imported only once the API is needed, so --list and --show-prompt skip
+    # loading the HTTP/TLS stack
+    from generate_image import (
+        get_api_key,
+        validate_image_size,
+        create_output_dir,
+        build_request_body,
+        make_api_request,
+        ApiError,
+        extract_image_data,
+        save_image,
+        format_size,
+        load_input_image,
+        DEFAULT_IMAGE_SIZE,
+    )
+
     # Get configuration
     api_key = get_api_key()
     model_id = args.model or os.environ.get("GEMINI_MODEL", DEFAULT_MODEL_ID)
@@ -301,10 +372,14 @@ Preset search order:
     # Load input images if provided (image-to-image mode)
     input_images = None
     if args.inputs:
-        input_images = []
-        for input_path_str in args.inputs:
-            input_path = Path(input_path_str)
-            input_images.append(load_input_image(input_path))
+        input_paths = [Path(input_path_str) for input_path_str in args.inputs]
+        if len(input_paths) > 1:
+            # Read and encode concurrently; map() keeps the order, which the
+            # prompt relies on ("first image", "second image")
+            with ThreadPoolExecutor(max_workers=min(8, len(input_paths))) as executor:
+                input_images = list(executor.map(load_input_image, input_paths))
+        else:
+            input_images = [load_input_image(input_paths[0])]
 
     # Create output directory
     create_output_dir(output_path)
@@ -322,7 +397,11 @@ Preset search order:
 
     # Build and send request
     request_body = build_request_body(full_prompt, image_size, input_images)
-    response = make_api_request(api_key, model_id, request_body)
+    try:
+        response = make_api_request(api_key, model_id, request_body)
+    except ApiError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        sys.exit(1)
 
     # Extract and save image
     image_data = extract_image_data(response)
@@ -339,21 +418,22 @@ Preset search order:
         final_path = remove_background(final_path, final_path)
     elif args.remove_white_bg:
         # Use luminosity-based removal (better for generated images with white bg)
+        # Imported here: it needs Pillow and numpy, which most runs never use
+        from remove_white_bg import remove_white_background
+
         print("Removing white background...")
         final_path = remove_white_background(final_path, final_path.with_suffix('.png'))
 
     # Convert to SVG if requested
     if args.output_svg:
+        # Imported here: only SVG output needs vtracer and Pillow
+        from convert_to_svg import convert_to_svg
+
         # Determine SVG palette: explicit --svg-palette, or first project preset from --preset
         svg_palette = args.svg_palette
-        if not svg_palette and args.preset:
+        if not svg_palette:
             # Extract first preset that's not a built-in (creative, mobile-ui)
-            builtin_presets = {"creative", "mobile-ui"}
-            for preset_name in args.preset.split(","):
-                preset_name = preset_name.strip()
-                if preset_name and preset_name not in builtin_presets:
-                    svg_palette = preset_name
-                    break
+            svg_palette = next((name for name in preset_names if name not in BUILTIN_PRESETS), None)
 
         # Use final_path (which has unique ID) as base for SVG output
         svg_path = convert_to_svg(
@@ -366,12 +446,15 @@ Preset search order:
         # Keep the raster as intermediate, report SVG as main output
         final_path = svg_path
 
-    # Verify and report
-    if final_path.exists() and final_path.stat().st_size > 0:
-        file_size = get_file_size(final_path)
+    # Verify and report (one stat for both the check and the size)
+    try:
+        saved_size = os.stat(final_path).st_size
+    except FileNotFoundError:
+        saved_size = 0
+    if saved_size > 0:
         print("Success! Image generated.")
         print(f"File: {final_path}")
-        print(f"Size: {file_size}")
+        print(f"Size: {format_size(saved_size)}")
     else:
         print(f"Error: Failed to save image to {final_path}", file=sys.stderr)
         sys.exit(1)
@@ -0,0 +1,8 @@
+"""
+Defaults shared by the imagen scripts.
+
+Kept free of heavy imports so scripts can show them (e.g. in --help)
+without loading generate_image and its HTTP/TLS stack.
+"""
+
+DEFAULT_MODEL_ID = "gemini-3.1-flash-image-preview"